@@ -12,8 +12,10 @@ bl_info = {
     }
     
 import bpy
+import sys
 
-from bpy.props import BoolProperty
+from bpy.app.handlers import persistent
+from bpy.props import BoolProperty, FloatProperty
 
 # The message to display in the panel
 message = ""
@@ -21,6 +23,12 @@ message = ""
 # The links that has been removed and may be recreated
 normal_links = []
 
+# The result of the last memory estimation: a list of (object name, micropolygons, bytes, displacement texels)
+estimates = []
+
+# Rough memory used by Cycles for each diced micropolygon: its two triangles, vertex, normal and BVH nodes
+BYTES_PER_MICROPOLYGON = 200
+
 #--------------------------------------------------------------------------------------------------------
 # Functions
 #--------------------------------------------------------------------------------------------------------
@@ -76,13 +84,177 @@ def toggle_microdisp(self, context):
     toggle_links(ntree)
         
 #--------------------------------------------------------------------------------------------------------
-# Properties
+# Memory Estimation
 #--------------------------------------------------------------------------------------------------------
-bpy.types.Scene.use_microdisp = BoolProperty(
-    name="Use microdisplacement feature",
-    default=False,
-    update=toggle_microdisp
-)
+def displacement_texels(ntree):
+    """ Return the number of texels of the biggest displacement map in the node tree """
+    texels = 0
+    for node in ntree.nodes:
+        if node.type == 'GROUP' and node.node_tree is not None:
+            texels = max(texels, displacement_texels(node.node_tree))
+        elif node.type == 'TEX_IMAGE' and node.image is not None:
+            # The displacement map is either named after it or linked to a Displacement socket
+            linked_to_displacement = any(link.to_socket.name == "Displacement" for output in node.outputs for link in output.links)
+            if node.name == "Displacement" or linked_to_displacement:
+                width, height = node.image.size
+                tiles = len(node.image.tiles) if node.image.source == 'TILED' else 1
+                texels = max(texels, width * height * tiles)
+    return texels
+
+
+def screen_coverage(scene, objects):
+    """ Return the fraction of the camera frame covered by the bounding box of each object """
+    import numpy as np
+    
+    camera = scene.camera
+    if camera is None:
+        # Without camera we cannot know, so we assume the worst case
+        return np.ones(len(objects))
+    
+    # Bounding box corners of all the objects in camera space: shape (objects, 8, 3)
+    corners = np.array([[tuple(corner) + (1,) for corner in ob.bound_box] for ob in objects])
+    matrices = np.array([[tuple(row) for row in ob.matrix_world] for ob in objects])
+    world_to_camera = np.array([tuple(row) for row in camera.matrix_world.normalized().inverted()])
+    co_local = np.einsum('ij,njk,nck->nci', world_to_camera, matrices, corners)[:, :, :3]
+    
+    # Same projection as bpy_extras.object_utils.world_to_camera_view
+    frame = -np.array([tuple(v) for v in camera.data.view_frame(scene=scene)[:3]])
+    z = -co_local[:, :, 2]
+    if camera.data.type != 'ORTHO':
+        depth = np.where(z > 0, z, 1) / frame[0][2]
+    else:
+        depth = np.ones_like(z)
+    x = (co_local[:, :, 0] - frame[1][0] * depth) / ((frame[2][0] - frame[1][0]) * depth)
+    y = (co_local[:, :, 1] - frame[0][1] * depth) / ((frame[1][1] - frame[0][1]) * depth)
+    
+    x, y = np.clip(x, 0, 1), np.clip(y, 0, 1)
+    coverage = (x.max(axis=1) - x.min(axis=1)) * (y.max(axis=1) - y.min(axis=1))
+    
+    # An object crossing the camera plane can cover the whole frame
+    if camera.data.type != 'ORTHO':
+        coverage = np.where((z <= 0).any(axis=1), 1.0, coverage)
+    return coverage
+
+
+def is_rendered(scene, ob):
+    """ Return whether an object is rendered: not hidden and on a layer used by an enabled render layer """
+    if ob.hide_render:
+        return False
+    if not hasattr(ob, "layers"):
+        return True
+    return any(ob.layers[i] and scene.layers[i] and render_layer.layers[i]
+               for render_layer in scene.render.layers if render_layer.use for i in range(len(ob.layers)))
+
+
+def estimate_memory(scene):
+    """ Estimate the number of micropolygons and the memory used by each subdivided object at render time """
+    import numpy as np
+    
+    objects = [ob for ob in scene.objects
+               if ob.type == 'MESH' and ob.modifiers.get("Subsurf") is not None and is_rendered(scene, ob)]
+    if not objects:
+        return []
+    
+    cscene = scene.cycles
+    render = scene.render
+    scale = render.resolution_percentage / 100
+    pixels = render.resolution_x * scale * render.resolution_y * scale
+    
+    faces = np.array([len(ob.data.polygons) for ob in objects], dtype=np.float64)
+    levels = np.array([ob.modifiers["Subsurf"].render_levels for ob in objects], dtype=np.float64)
+    adaptive = np.array([cscene.feature_set == 'EXPERIMENTAL' and ob.cycles.use_adaptive_subdivision for ob in objects])
+    dicing_rates = cscene.dicing_rate * np.array([getattr(ob.cycles, "dicing_rate", 1.0) for ob in objects])
+    
+    # Adaptive subdivision dices the surface into micropolygons of about dicing_rate pixels wide,
+    # both on the front and the back of the objects, up to the maximum number of subdivisions
+    max_subdivisions = getattr(cscene, "max_subdivisions", 12)
+    adaptive_count = np.minimum(2 * screen_coverage(scene, objects) * pixels / dicing_rates ** 2, faces * 4.0 ** max_subdivisions)
+    adaptive_count = np.maximum(adaptive_count, faces)
+    
+    # Otherwise each face is split in 4 at each level
+    micropolygons = np.where(adaptive, adaptive_count, faces * 4.0 ** levels)
+    
+    texels = [max([displacement_texels(slot.material.node_tree) for slot in ob.material_slots
+                   if slot.material is not None and slot.material.node_tree is not None] or [0]) for ob in objects]
+    
+    return [(ob.name, int(count), int(count * BYTES_PER_MICROPOLYGON), texel_count)
+            for ob, count, texel_count in zip(objects, micropolygons, texels)]
+
+
+def format_size(size):
+    """ Format a number of bytes in a readable way """
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return "%.1f %s" % (size, unit)
+        size /= 1024
+    return "%.1f TB" % size
+
+
+def memory_warning(total, limit):
+    """ Return a warning if total bytes exceed the limit in GB, else an empty string """
+    if limit <= 0 or total <= limit * 1024 ** 3:
+        return ""
+    return "Subdivision may use " + format_size(total) + ", more than the limit of %g GB" % limit
+
+
+def check_memory(scene, limit=None):
+    """ Return a warning if the subdivision is expected to use more memory than the limit in GB, else an empty string """
+    if limit is None:
+        limit = scene.microdisp_memory_limit
+    if limit <= 0:
+        return ""
+    return memory_warning(sum(estimate[2] for estimate in estimate_memory(scene)), limit)
+
+
+@persistent
+def check_render_memory(scene):
+    """ Warn before a render when the subdivision is expected to use more memory than the limit
+    
+    The render cannot be stopped from here: the check is done before submitting a job with
+    the Check Render Memory operator or the --check-memory option. """
+    global message
+    warning = check_memory(scene)
+    if warning == "":
+        return
+    
+    message = warning
+    print("Microdisplacement Helper: " + message)
+        
+
+#--------------------------------------------------------------------------------------------------------
+# Operators
+#--------------------------------------------------------------------------------------------------------
+class EstimateMemory(bpy.types.Operator):
+    """Estimate the number of micropolygons and the memory used by the subdivided objects at render time"""
+    bl_idname = "microdisp.estimate_memory"
+    bl_label = "Estimate Render Memory"
+    
+    def execute(self, context):
+        global estimates
+        estimates = estimate_memory(context.scene)
+        
+        total = sum(estimate[2] for estimate in estimates)
+        warning = memory_warning(total, context.scene.microdisp_memory_limit)
+        if warning != "":
+            self.report({'WARNING'}, warning)
+        else:
+            self.report({'INFO'}, "Subdivision memory: " + format_size(total))
+        return {'FINISHED'}
+
+
+class CheckMemory(bpy.types.Operator):
+    """Fail if the subdivided objects are expected to use more memory than the limit, to run before submitting a render job"""
+    bl_idname = "microdisp.check_memory"
+    bl_label = "Check Render Memory"
+    
+    def execute(self, context):
+        warning = check_memory(context.scene)
+        if warning != "":
+            self.report({'ERROR'}, warning)
+            return {'CANCELLED'}
+        
+        self.report({'INFO'}, "Subdivision memory within the limit")
+        return {'FINISHED'}
 
 
 #--------------------------------------------------------------------------------------------------------
@@ -119,13 +291,19 @@ class MaterialPanel(bpy.types.Panel):
         if message != "":
             layout.label(message)
         
-        if "Subsurf" not in ob.modifiers.keys():
+        # The content of the materials generated by PBR Material from Textures is indexed in the scene
+        entry = scene.get("mft_inventory", {}).get(mat.name)
+        if entry is not None and entry["microdisp"] and "Displacement" not in entry["maps"]:
+            layout.label("This PBR material has no displacement map", icon="ERROR")
+        
+        subsurf = ob.modifiers.get("Subsurf")
+        if subsurf is None:
             return
         
         box = layout.box()
         box.label("Settings")
         
-        box.row().prop(ob.modifiers["Subsurf"], 'subdivision_type', expand=True)
+        box.row().prop(subsurf, 'subdivision_type', expand=True)
         
         split = box.split()
                 
@@ -133,7 +311,7 @@ class MaterialPanel(bpy.types.Panel):
             
         sub = col.column(align=True)
         sub.label("Subsurf:")
-        sub.prop(ob.modifiers["Subsurf"], 'levels', text="View")
+        sub.prop(subsurf, 'levels', text="View")
             
         if feature_set == 'EXPERIMENTAL':
             sub.prop(ob.cycles, "use_adaptive_subdivision", text="Adaptive")
@@ -145,18 +323,61 @@ class MaterialPanel(bpy.types.Panel):
             sub.prop(cscene, "dicing_rate", text="Render")
             sub.prop(cscene, "preview_dicing_rate", text="Preview")
         else:
-            sub.prop(ob.modifiers["Subsurf"], 'render_levels', text="Render")
+            sub.prop(subsurf, 'render_levels', text="Render")
+            
+        # Memory estimation
+        box = layout.box()
+        box.operator("microdisp.estimate_memory", icon="MEMORY")
+        
+        box.row().prop(scene, "microdisp_memory_limit", text="Limit (GB)")
+        
+        if estimates:
+            col = box.column(align=True)
+            for name, micropolygons, size, texels in estimates:
+                col.label("%s: %d micropolygons, %s" % (name, micropolygons, format_size(size)))
+                if texels and micropolygons > texels:
+                    col.label("  finer than its displacement map, the dicing rate could be higher", icon="INFO")
+            col.label("Total: " + format_size(sum(estimate[2] for estimate in estimates)))
 
 
 #--------------------------------------------------------------------------------------------------------
 # Register
 #--------------------------------------------------------------------------------------------------------
 def register():
+    bpy.types.Scene.use_microdisp = BoolProperty(
+        name="Use microdisplacement feature",
+        default=False,
+        update=toggle_microdisp
+    )
+    bpy.types.Scene.microdisp_memory_limit = FloatProperty(
+        name="Memory limit",
+        description="Memory in GB that the subdivision should not exceed at render time (0 to disable the check)",
+        default=0,
+        min=0
+    )
+    bpy.utils.register_class(EstimateMemory)
+    bpy.utils.register_class(CheckMemory)
     bpy.utils.register_class(MaterialPanel)
+    bpy.app.handlers.render_init.append(check_render_memory)
 
 
 def unregister():
+    bpy.app.handlers.render_init.remove(check_render_memory)
     bpy.utils.unregister_class(MaterialPanel)
+    bpy.utils.unregister_class(CheckMemory)
+    bpy.utils.unregister_class(EstimateMemory)
+    del bpy.types.Scene.use_microdisp
+    del bpy.types.Scene.microdisp_memory_limit
 
 if __name__ == "__main__":
-    register()
\ No newline at end of file
+    register()
+    
+    # Check before submitting a render job, the limit in GB defaults to the one of the scene:
+    # blender -b scene.blend --python microdisplacement_helper.py -- --check-memory [limit]
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+    if argv and argv[0] == "--check-memory":
+        warning = check_memory(bpy.context.scene, float(argv[1]) if len(argv) > 1 else None)
+        if warning != "":
+            print("Microdisplacement Helper: " + warning)
+            sys.exit(1)
+        print("Microdisplacement Helper: subdivision memory within the limit")
\ No newline at end of file
@@ -11,14 +11,173 @@ bl_info = {
     "category": "Material"}
 
 import bpy
+import os
+import re
+import sys
 
-from bpy_extras.io_utils import ImportHelper
+from bpy_extras.io_utils import ImportHelper, ExportHelper
+from bpy.app.handlers import persistent
 from bpy.props import CollectionProperty, StringProperty, IntProperty, BoolProperty, EnumProperty, PointerProperty, FloatProperty
 from bpy.types import Operator, AddonPreferences
 
 from collections import OrderedDict
 
 
+# The preferences holding the suffixes of each map type, and the type they are associated with
+SUFFIX_TYPES = OrderedDict([
+    ('diffuse_suffixes', 'Col'),
+    ('albedo_suffixes', 'Col'),
+    ('ao_suffixes', 'AO'),
+    ('roughness_suffixes', 'Rou'),
+    ('glossiness_suffixes', 'Glo'),
+    ('normal_suffixes', 'Nor'),
+    ('bump_suffixes', 'Bum'),
+    ('height_suffixes', 'Dis'),
+    ('metallic_suffixes', 'Met'),
+    ('specular_suffixes', 'Spec')
+])
+
+# The default values for the file suffixes
+DEFAULT_SUFFIXES = {
+    'diffuse_suffixes': "Dif;Diffuse;BaseColor;Color;COL",
+    'albedo_suffixes': "Alb;Albedo;ALBEDO",
+    'ao_suffixes': "AO;Occlusion;OCCLUSION",
+    'roughness_suffixes': "Rou;Roughness",
+    'glossiness_suffixes': "Gloss;Glossiness;GLOSS",
+    'normal_suffixes': "Nor;Normal;NRM;NORMAL",
+    'bump_suffixes': "Bump",
+    'height_suffixes': "Dis;Displacement;Height;DISP;DISPLACEMENT",
+    'metallic_suffixes': "Met;Metallic;METALNESS",
+    'specular_suffixes': "Ref;REFL;Specular;Reflection",
+    'directx_suffixes': "DX;DirectX",
+    'opengl_suffixes': "GL;OpenGL"
+}
+
+# The name of the image texture node of each map type in the node group
+MAP_NODES = {
+    'AO': "Ambient Occlusion",
+    'Col': "Color",
+    'Dis': "Displacement",
+    'Nor': "Normal",
+    'Rou': "Roughness",
+    'Glo': "Glossiness",
+    'Met': "Metallic",
+    'Spec': "Specular",
+    'Bum': "Bump"
+}
+
+# The UDIM tile number at the end of a file name, like in Color.1001.exr or Color_1001.exr
+UDIM_PATTERN = re.compile(r'^.*[._](1\d{3})\.[^.]+$')
+
+# The directory, next to the textures, where the normal maps converted to the OpenGL convention are cached
+NORMAL_CACHE_DIR = "mft_cache"
+
+
+#--------------------------------------------------------------------------------------------------------
+# Shared Mapping
+#--------------------------------------------------------------------------------------------------------
+# The Scale group is shared by all the materials. Increment the version when its content changes,
+# so that the materials created with a previous version keep their own group.
+SCALE_TREE_VERSION = 1
+SCALE_TREE_NAME = "PBR Scale v%d" % SCALE_TREE_VERSION
+
+
+def get_scale_tree():
+    """return the Scale group shared by all the materials, and create it if it does not exist yet"""
+    # The group is found by its version, it may have been renamed. The linked groups cannot be modified
+    # and drive their values from the scene, so the materials of the file don't use them
+    for node_group in bpy.data.node_groups:
+        if node_group.get("mft_version") == SCALE_TREE_VERSION and node_group.library is None:
+            return node_group
+    
+    # A group with the name but without the version is taken over instead of adding a numbered copy
+    scale_tree = bpy.data.node_groups.get(SCALE_TREE_NAME)
+    if scale_tree is not None and scale_tree.library is None:
+        scale_tree.nodes.clear()
+        scale_tree.inputs.clear()
+        scale_tree.outputs.clear()
+    else:
+        scale_tree = bpy.data.node_groups.new(type="ShaderNodeTree", name=SCALE_TREE_NAME)
+    scale_tree["mft_version"] = SCALE_TREE_VERSION
+    scale_nodes = scale_tree.nodes
+    
+    scale_tree.inputs.new("NodeSocketVector", "Vector")
+    scale_tree.inputs.new("NodeSocketFloat", "Scale")
+    scale_tree.outputs.new("NodeSocketVector", "Vector")
+    
+    input_node = scale_nodes.new("NodeGroupInput")
+    input_node.location = (-300, 0)
+    output_node = scale_nodes.new("NodeGroupOutput")
+    output_node.location = (700, 0)
+    
+    # Scale of the material
+    mix_node = scale_nodes.new("ShaderNodeMixRGB")
+    mix_node.inputs[0].default_value = 1
+    mix_node.blend_type = 'MULTIPLY'
+    
+    # Scale and offset of the whole scene, driven by the scene properties when the global mapping is enabled
+    global_scale = scale_nodes.new("ShaderNodeValue")
+    global_scale.name = "Global Scale"
+    global_scale.label = "Global Scale"
+    global_scale.location = (0, -200)
+    global_scale.outputs[0].default_value = 1
+    
+    global_mix = scale_nodes.new("ShaderNodeMixRGB")
+    global_mix.name = "Global Multiply"
+    global_mix.location = (200, 0)
+    global_mix.inputs[0].default_value = 1
+    global_mix.blend_type = 'MULTIPLY'
+    
+    global_offset = scale_nodes.new("ShaderNodeCombineXYZ")
+    global_offset.name = "Global Offset"
+    global_offset.label = "Global Offset"
+    global_offset.location = (200, -200)
+    
+    offset_node = scale_nodes.new("ShaderNodeVectorMath")
+    offset_node.name = "Offset"
+    offset_node.location = (450, 0)
+    offset_node.operation = 'ADD'
+    
+    scale_tree.links.new(input_node.outputs[0], mix_node.inputs[1])
+    scale_tree.links.new(input_node.outputs[1], mix_node.inputs[2])
+    scale_tree.links.new(mix_node.outputs[0], global_mix.inputs[1])
+    scale_tree.links.new(global_scale.outputs[0], global_mix.inputs[2])
+    scale_tree.links.new(global_mix.outputs[0], offset_node.inputs[0])
+    scale_tree.links.new(global_offset.outputs[0], offset_node.inputs[1])
+    scale_tree.links.new(offset_node.outputs[0], output_node.inputs[0])
+    
+    return scale_tree
+
+
+def add_scene_driver(socket, scene, data_path):
+    """drive the value of a socket with a property of the scene"""
+    driver = socket.driver_add("default_value").driver
+    driver.type = 'AVERAGE'
+    variable = driver.variables.new()
+    variable.type = 'SINGLE_PROP'
+    variable.targets[0].id_type = 'SCENE'
+    variable.targets[0].id = scene
+    variable.targets[0].data_path = data_path
+
+
+def set_global_mapping(self, context):
+    """drive the scale and offset of all the materials with the scene properties, or stop driving them"""
+    scale_nodes = get_scale_tree().nodes
+    scale_socket = scale_nodes["Global Scale"].outputs[0]
+    offset_sockets = scale_nodes["Global Offset"].inputs
+    
+    if self.use_global_mapping:
+        add_scene_driver(scale_socket, self.id_data, "mft_props.global_scale")
+        for i in range(3):
+            add_scene_driver(offset_sockets[i], self.id_data, "mft_props.global_offset[%d]" % i)
+    else:
+        scale_socket.driver_remove("default_value")
+        scale_socket.default_value = 1
+        for i in range(3):
+            offset_sockets[i].driver_remove("default_value")
+            offset_sockets[i].default_value = 0
+
+
 #--------------------------------------------------------------------------------------------------------
 # Settings
 #--------------------------------------------------------------------------------------------------------
@@ -26,7 +185,10 @@ def set_mapping(self, context):
     """set the texture coordinate mapping"""
     value = int(self.mapping)
     
-    ntree = context.active_object.active_material.node_tree
+    material = context.active_object.active_material if context.active_object else None
+    if material is None or material.node_tree is None:
+        return
+    ntree = material.node_tree
     # we first test if there are texture coordinate and mapping nodes in the base tree
     # to work with all materials
     if "Texture Coordinate" in ntree.nodes.keys() and "Mapping" in ntree.nodes.keys():
@@ -36,7 +198,7 @@ def set_mapping(self, context):
             
     # we then go in the PBR node group
     if "Group" in ntree.nodes.keys():
-        ntree = context.active_object.active_material.node_tree.nodes["Group"].node_tree
+        ntree = ntree.nodes["Group"].node_tree
         if "Texture Coordinate" in ntree.nodes.keys() and "Mapping" in ntree.nodes.keys():
             tex_coord = ntree.nodes["Texture Coordinate"]
             mapping = ntree.nodes["Mapping"]
@@ -45,22 +207,35 @@ def set_mapping(self, context):
 def set_projection(self, context):
     """set the projection of a 2D image on a 3D object"""
     value = self.projection
-    for node in context.active_object.active_material.node_tree.nodes["Group"].node_tree.nodes:
+    material = context.active_object.active_material if context.active_object else None
+    if material is None or material.node_tree is None or "Group" not in material.node_tree.nodes.keys():
+        return
+    for node in material.node_tree.nodes["Group"].node_tree.nodes:
         if node.type == 'TEX_IMAGE':
             node.projection = value
             
 
+# The outputs of the Texture Coordinate node
+MAPPINGS = [('0', 'Generated', 'Automatically-generated texture coordinates from the vertex positions of the mesh without deformation.'),
+    ('1', 'Normal', 'Object space normal, for texturing objects with the texture staying fixed on the object as it transformed.'),
+    ('2', 'UV', 'UV texture coordinates from the active render UV map.'),
+    ('3', 'Object', 'Position coordinate in object space.'),
+    ('4', 'Camera', 'Position coordinate in camera space.'),
+    ('5', 'Window', 'Location of shading point on the screen, ranging from 0.0 to 1. 0 from the left to right side and bottom to top of the render.'),
+    ('6', 'Reflection', 'Vector in the direction of a sharp reflection, typically used for environment maps.')]
+
+# The projections of the Image Texture nodes
+PROJECTIONS = [('FLAT', 'Flat', 'Image is projected flat using the X and Y coordinates of the texture vector.'),
+    ('BOX', 'Box', 'Image is projected using different components for each side of the object space bounding box.'),
+    ('SPHERE', 'Sphere', 'Sphere, Image is projected spherically using the Z axis as central.'),
+    ('TUBE', 'Tube', 'Image is projected from the tube using the Z axis as central.')]
+
+
 class PBRMaterialProperties(bpy.types.PropertyGroup):
     """The set of properties to tweak the material"""
     mapping = bpy.props.EnumProperty(
         name="Vector",
-        items=[('0', 'Generated', 'Automatically-generated texture coordinates from the vertex positions of the mesh without deformation.'),
-            ('1', 'Normal', 'Object space normal, for texturing objects with the texture staying fixed on the object as it transformed.'),
-            ('2', 'UV', 'UV texture coordinates from the active render UV map.'),
-            ('3', 'Object', 'Position coordinate in object space.'),
-            ('4', 'Camera', 'Position coordinate in camera space.'),
-            ('5', 'Window', 'Location of shading point on the screen, ranging from 0.0 to 1. 0 from the left to right side and bottom to top of the render.'),
-            ('6', 'Reflection', 'Vector in the direction of a sharp reflection, typically used for environment maps.')],
+        items=MAPPINGS,
         description="Calculation of the texture vector",
         update=set_mapping,
         default='2',
@@ -68,15 +243,339 @@ class PBRMaterialProperties(bpy.types.PropertyGroup):
 
     projection = bpy.props.EnumProperty(
         name="Projection",
-        items=[('FLAT', 'Flat', 'Image is projected flat using the X and Y coordinates of the texture vector.'),
-            ('BOX', 'Box', 'Image is projected using different components for each side of the object space bounding box.'),
-            ('SPHERE', 'Sphere', 'Sphere, Image is projected spherically using the Z axis as central.'),
-            ('TUBE', 'Tube', 'Image is projected from the tube using the Z axis as central.')],
+        items=PROJECTIONS,
         description="Method to project 2D image on object with a 3D texture vector",
         update=set_projection,
         default='FLAT',
     )
     
+    use_global_mapping = bpy.props.BoolProperty(
+        name="Global Mapping",
+        description="Control the scale and offset of all the PBR materials from the scene",
+        update=set_global_mapping,
+        default=False,
+    )
+    
+    global_scale = bpy.props.FloatProperty(
+        name="Scale",
+        description="Scale applied to the textures of all the PBR materials",
+        min=0,
+        default=1,
+    )
+    
+    global_offset = bpy.props.FloatVectorProperty(
+        name="Offset",
+        description="Offset applied to the textures of all the PBR materials",
+        subtype='TRANSLATION',
+        size=3,
+    )
+    
+
+#--------------------------------------------------------------------------------------------------------
+# Texture Loading
+#--------------------------------------------------------------------------------------------------------
+def get_import_settings(prefs):
+    """copy the settings used to sort the files out of the add-on preferences"""
+    settings = {name: getattr(prefs, name) for name in DEFAULT_SUFFIXES.keys()}
+    settings['detect_normal_format'] = prefs.detect_normal_format
+    settings['normal_cache_directory'] = bpy.path.abspath(prefs.normal_cache_directory)
+    return settings
+
+
+# The suffix index and the settings it was built from. It is only built when textures are sorted
+# for the first time, and rebuilt when the suffixes change in the preferences.
+suffix_index = {}
+suffix_index_settings = None
+
+
+def get_suffix_index(settings):
+    """return a dictionnary associating each suffix with its map type"""
+    global suffix_index, suffix_index_settings
+    key = tuple(settings[name] for name in SUFFIX_TYPES.keys())
+    if key != suffix_index_settings:
+        suffix_index = {}
+        for type, map_type in SUFFIX_TYPES.items():
+            for suffix in settings[type].split(';'):
+                # The first type in the list wins if a suffix is used twice
+                suffix_index.setdefault(suffix, map_type)
+        suffix_index_settings = key
+    return suffix_index
+
+
+def get_material_name(file_names):
+    """find the name of the material based on the textures name"""
+    name1 = file_names[0].split('_')
+    name2 = file_names[-1].split('_')
+    intersection = set(name1).intersection(name2)
+    name = ""
+    for elt in intersection:
+        elt = elt[0].upper() + elt[1:].lower()
+        if "k" in elt:
+            # there is the resolution of the texture, we don't want it
+            continue
+        name += " " + elt
+    return name
+
+
+def tag_material(material, directory, file_names):
+    """remember the files a material is made of, so that it can be refreshed later"""
+    material["mft_source"] = directory
+    material["mft_files"] = ";".join(file_names)
+
+
+def get_pbr_group(material):
+    """return the node group generated by this add-on in a material, or None"""
+    if material is None or material.node_tree is None or "Group" not in material.node_tree.nodes.keys():
+        return None
+    group = material.node_tree.nodes["Group"]
+    if group.node_tree is None or "Scale" not in group.node_tree.nodes.keys():
+        return None
+    return group
+
+
+def get_map_type(file_name, settings):
+    """find the type of map (Col, Nor, etc) of a file from the suffixes in its name"""
+    name_list = file_name.split('.')[0].split('_')
+    index = get_suffix_index(settings)
+    
+    # We browse the name parts until we find the texture type
+    for extension in reversed(name_list):
+        if extension in index:
+            return index[extension]
+    return None
+
+
+def get_tiles_warning(tile_paths):
+    """return a warning if a UDIM map has several tiles, of which only the first one is used, else None"""
+    if len(tile_paths) < 2:
+        return None
+    first = min(tile_paths.keys())
+    return "%s: tiled images are not supported, only the tile %d of the %d tiles is used" \
+        % (os.path.basename(tile_paths[first]), first, len(tile_paths))
+
+
+def load_first_tile(tile_paths, warnings=None):
+    """load the first tile of a UDIM map, and add a warning to the warnings about the other tiles
+    
+    The versions of Blender this add-on works with cannot load several tiles as a single image."""
+    image = bpy.data.images.load(tile_paths[min(tile_paths.keys())], check_existing=True)
+    
+    warning = get_tiles_warning(tile_paths)
+    if warning is not None:
+        print(warning)
+        if warnings is not None:
+            warnings.append(warning)
+    return image
+
+
+def read_pixels(image):
+    """return the pixels of an image as an array of shape (height, width, channels)"""
+    import numpy as np
+    width, height = image.size
+    pixels = np.empty(width * height * image.channels, dtype=np.float32)
+    if hasattr(image.pixels, "foreach_get"):
+        image.pixels.foreach_get(pixels)
+    else:
+        pixels[:] = image.pixels[:]
+    return pixels.reshape(height, width, image.channels)
+
+
+def read_pixel_sample(image, size):
+    """return the pixels of an image scaled down to fit in size x size, as an array of shape (height, width, channels)"""
+    width, height = image.size
+    if width <= size and height <= size:
+        return read_pixels(image)
+    
+    # The image is scaled down by Blender, so that only the pixels of the sample are copied to Python
+    factor = size / max(width, height)
+    sample = image.copy()
+    try:
+        sample.scale(max(1, int(width * factor)), max(1, int(height * factor)))
+        return read_pixels(sample)
+    finally:
+        bpy.data.images.remove(sample)
+
+
+def guess_directx_normal(image):
+    """guess from its pixels whether a normal map uses the DirectX convention (green channel pointing down)"""
+    import numpy as np
+    width, height = image.size
+    if width < 8 or height < 8:
+        return False
+    
+    # A sample of about 512 x 512 pixels is enough
+    image.colorspace_settings.name = 'Non-Color'
+    normals = read_pixel_sample(image, 512)[..., :3] * 2 - 1
+    nz = np.maximum(normals[..., 2], 0.1)
+    slope_x, slope_y = -normals[..., 0] / nz, -normals[..., 1] / nz
+    
+    # The slopes of a real surface have no curl: the convention of the green channel
+    # which gives the smallest curl is the right one
+    curl_opengl = np.abs(np.gradient(slope_y, axis=1) - np.gradient(slope_x, axis=0)).mean()
+    curl_directx = np.abs(-np.gradient(slope_y, axis=1) - np.gradient(slope_x, axis=0)).mean()
+    return curl_directx < 0.8 * curl_opengl
+
+
+def is_up_to_date(cache_path, path):
+    """find whether a file cached from another one exists and is more recent"""
+    return os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(path)
+
+
+def is_directx_normal(path, settings):
+    """find whether a normal map uses the DirectX convention, from its name or else from its pixels
+    
+    The pixels are only analysed the first time: the result is kept in a file in the cache directory
+    and in the image, until the normal map changes."""
+    name_list = os.path.basename(path).split('.')[0].split('_')
+    if any(part in settings['directx_suffixes'].split(';') for part in name_list):
+        return True
+    if any(part in settings['opengl_suffixes'].split(';') for part in name_list):
+        return False
+    if not settings.get('detect_normal_format'):
+        return False
+    
+    cache_dir = get_normal_cache_dir(path, settings)
+    format_path = os.path.join(cache_dir, os.path.basename(path) + ".format") if cache_dir is not None else None
+    if format_path is not None and is_up_to_date(format_path, path):
+        with open(format_path) as format_file:
+            return format_file.read().strip() == 'DX'
+    
+    image = bpy.data.images.load(path, check_existing=True)
+    if image.get("mft_normal_format") is None:
+        image["mft_normal_format"] = 'DX' if guess_directx_normal(image) else 'GL'
+    
+    if format_path is not None:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            with open(format_path, 'w') as format_file:
+                format_file.write(image["mft_normal_format"])
+        except OSError:
+            # The result is still kept in the image for this session
+            pass
+    return image["mft_normal_format"] == 'DX'
+
+
+def is_float_file(path):
+    """find from the header of an image file whether Blender loads it as a float image"""
+    result = scan_file(path)
+    if "bit_depth" in result:
+        return result["format"] == "OPEN_EXR" or result["bit_depth"] > 8
+    return os.path.splitext(path)[1].lower() in (".exr", ".hdr", ".tif", ".tiff")
+
+
+def get_normal_cache_dir(path, settings):
+    """return the directory where the OpenGL copy of a normal map is cached, or None if there is none
+    
+    The copies are cached next to the textures, or in the directory set in the preferences.
+    They must persist as long as the materials use them."""
+    directory = os.path.dirname(os.path.abspath(path))
+    if settings.get('normal_cache_directory'):
+        # The directory of each texture set gets its own sub-directory, as different sets may use the same file names
+        import hashlib
+        return os.path.join(settings['normal_cache_directory'], hashlib.md5(directory.encode()).hexdigest()[:12])
+    if not os.access(directory, os.W_OK):
+        return None
+    return os.path.join(directory, NORMAL_CACHE_DIR)
+
+
+def convert_directx_normal(path, settings):
+    """flip the green channel of a DirectX normal map into a cached OpenGL copy and return the path of the copy"""
+    file_name = os.path.basename(path)
+    cache_dir = get_normal_cache_dir(path, settings)
+    if cache_dir is None:
+        raise RuntimeError("Cannot convert the DirectX normal map " + file_name + ": its directory is read-only. "
+                           "Set a directory for the converted normal maps in the add-on preferences")
+    
+    # The copy is written losslessly: in EXR if the image is loaded as float (EXR, 16 bit PNG, etc), in PNG otherwise
+    is_float = is_float_file(path)
+    cache_path = os.path.join(cache_dir, os.path.splitext(file_name)[0] + (".exr" if is_float else ".png"))
+    
+    # The conversion is only done once, until the original file changes
+    if is_up_to_date(cache_path, path):
+        return cache_path
+    
+    print("Converting DirectX normal map: " + file_name)
+    image = bpy.data.images.load(path, check_existing=True)
+    # Read the values of the file without color transform
+    image.colorspace_settings.name = 'Non-Color'
+    width, height = image.size
+    pixels = read_pixels(image)
+    pixels[..., 1] = 1 - pixels[..., 1]
+    
+    converted = bpy.data.images.new(file_name, width, height, alpha=image.channels == 4, float_buffer=is_float)
+    converted.colorspace_settings.name = 'Non-Color'
+    if hasattr(converted.pixels, "foreach_set"):
+        converted.pixels.foreach_set(pixels.ravel())
+    else:
+        converted.pixels[:] = pixels.ravel()
+    os.makedirs(cache_dir, exist_ok=True)
+    converted.filepath_raw = cache_path
+    converted.file_format = 'OPEN_EXR' if is_float else 'PNG'
+    converted.save()
+    
+    bpy.data.images.remove(converted)
+    if image.users == 0:
+        bpy.data.images.remove(image)
+    return cache_path
+
+
+def is_converted_normal(path, settings):
+    """find whether a file is a copy of a normal map already converted to the OpenGL convention"""
+    directory = os.path.dirname(os.path.abspath(path))
+    if os.path.basename(directory) == NORMAL_CACHE_DIR:
+        return True
+    cache_root = settings.get('normal_cache_directory')
+    return bool(cache_root) and os.path.dirname(directory) == os.path.abspath(cache_root)
+
+
+def get_opengl_normal_paths(map_tiles, settings):
+    """return the files of a normal map, converted to the OpenGL convention if they use the DirectX one"""
+    first_tile = sorted(map_tiles.keys(), key=lambda number: number or 0)[0]
+    # The copies keep the name of the original, which may still tell the DirectX convention
+    if is_converted_normal(map_tiles[first_tile], settings) or not is_directx_normal(map_tiles[first_tile], settings):
+        return map_tiles
+    return {number: convert_directx_normal(path, settings) for number, path in map_tiles.items()}
+
+
+def tag_converted_normal(image, map_tiles):
+    """remember the original files of a converted normal map, so that the material is described with them"""
+    image["mft_original"] = ";".join(map_tiles[number] for number in sorted(map_tiles.keys(), key=lambda number: number or 0))
+
+
+def load_images(paths, settings, warnings=None):
+    """load the images and return a dictionnary with each map associated to a type
+    
+    The problems which don't prevent the maps from loading are added to the warnings."""
+    # Gather the files of each map type, with their UDIM tile number if there is one
+    tiles = {}
+    for path in paths:
+        file_name = os.path.basename(path)
+        map_type = get_map_type(file_name, settings)
+        if map_type is None:
+            continue
+        match = UDIM_PATTERN.match(file_name)
+        tile = int(match.group(1)) if match else None
+        tiles.setdefault(map_type, {})[tile] = path
+    
+    # The Normal Map node expects the OpenGL convention: the green channel of DirectX maps is flipped once here
+    normal_tiles = tiles.get('Nor')
+    if normal_tiles is not None:
+        tiles['Nor'] = get_opengl_normal_paths(normal_tiles, settings)
+    
+    images = {}
+    for map_type, map_tiles in tiles.items():
+        numbered_tiles = {number: path for number, path in map_tiles.items() if number is not None}
+        if len(numbered_tiles) > 1:
+            images[map_type] = load_first_tile(numbered_tiles, warnings)
+        else:
+            path = map_tiles.get(None) or list(numbered_tiles.values())[0]
+            print("Loading file: " + os.path.basename(path))
+            images[map_type] = bpy.data.images.load(path, check_existing=True)
+    
+    if normal_tiles is not None and tiles['Nor'] is not normal_tiles:
+        tag_converted_normal(images['Nor'], normal_tiles)
+    return images
+
 
 #--------------------------------------------------------------------------------------------------------
 # PBR Node Tree
@@ -86,10 +585,12 @@ class PbrNodeTree:
     
     IMAGES = {}
     
-    def init(material_name):
+    def init(material_name, material=None):
 
         # Create the class attributes
-        PbrNodeTree.base_tree = bpy.context.active_object.active_material.node_tree
+        if material is None:
+            material = bpy.context.active_object.active_material
+        PbrNodeTree.base_tree = material.node_tree
         PbrNodeTree.base_tree.nodes.clear()  
         
         PbrNodeTree.ntree = bpy.data.node_groups.new(type="ShaderNodeTree", name=material_name)
@@ -98,24 +599,103 @@ class PbrNodeTree:
         PbrNodeTree.pbr_group = PbrNodeTree.base_tree.nodes.new("ShaderNodeGroup")
         PbrNodeTree.pbr_group .node_tree = PbrNodeTree.ntree
         PbrNodeTree.pbr_group .width = 250
-
-        input_node = PbrNodeTree.nodes.new("NodeGroupInput")
-        input_node.location = (-1800, -300)
-        output_node = PbrNodeTree.nodes.new("NodeGroupOutput")
-        output_node.location = (350, 0)
         
         # Create a startup node tree : material output and principled shader
         material_output = PbrNodeTree.base_tree.nodes.new("ShaderNodeOutputMaterial")
         material_output.location = (300, 0)
         
-        PbrNodeTree.ntree.outputs.new("NodeSocketShader", "Surface")
+        PbrNodeTree.init_group()
         PbrNodeTree.base_tree.links.new(PbrNodeTree.pbr_group .outputs[0], material_output.inputs[0])
         
+    def init_group():
+        """create the nodes common to all the node groups"""
+        input_node = PbrNodeTree.nodes.new("NodeGroupInput")
+        input_node.location = (-1800, -300)
+        output_node = PbrNodeTree.nodes.new("NodeGroupOutput")
+        output_node.location = (350, 0)
+        
+        PbrNodeTree.ntree.outputs.new("NodeSocketShader", "Surface")
+        
         PbrNodeTree.nodes.new("ShaderNodeBsdfPrincipled")
         PbrNodeTree.add_link("Principled BSDF", 0, "Group Output", 0)
         
         # Add texture coordinates and mapping nodes
         PbrNodeTree.add_tex_coord()
+        
+    def rebuild(material):
+        """empty the node group of a material and fill it again with the images, keeping the values of its inputs
+        and the links of its outputs"""
+        PbrNodeTree.base_tree = material.node_tree
+        PbrNodeTree.pbr_group = material.node_tree.nodes["Group"]
+        PbrNodeTree.ntree = PbrNodeTree.pbr_group.node_tree
+        PbrNodeTree.nodes = PbrNodeTree.ntree.nodes
+        
+        values = {socket.name: socket.default_value for socket in PbrNodeTree.pbr_group.inputs}
+        mapping, projection = PbrNodeTree.get_mapping_settings(PbrNodeTree.ntree)
+        output_links = [(link.from_socket.name, link.to_socket) for link in PbrNodeTree.base_tree.links
+                        if link.from_node == PbrNodeTree.pbr_group]
+        
+        PbrNodeTree.nodes.clear()
+        PbrNodeTree.ntree.inputs.clear()
+        PbrNodeTree.ntree.outputs.clear()
+        
+        PbrNodeTree.init_group()
+        PbrNodeTree.fill_tree()
+        PbrNodeTree.set_controllers()
+        PbrNodeTree.set_mapping_settings(mapping, projection)
+        
+        outputs = PbrNodeTree.pbr_group.outputs
+        for name, to_socket in output_links:
+            if name in outputs.keys():
+                PbrNodeTree.base_tree.links.new(outputs[name], to_socket)
+        
+        inputs = PbrNodeTree.pbr_group.inputs
+        for name, value in values.items():
+            if name in inputs.keys():
+                inputs[name].default_value = value
+        
+    def get_mapping_settings(group_tree):
+        """return the output of the Texture Coordinate node used by the mapping, and the projection of the images"""
+        mapping = bpy.context.scene.mft_props.mapping
+        projection = bpy.context.scene.mft_props.projection
+        for link in group_tree.links:
+            if link.from_node.name == "Texture Coordinate" and link.to_node.name == "Mapping":
+                mapping = str([socket.identifier for socket in link.from_node.outputs].index(link.from_socket.identifier))
+        for node in group_tree.nodes:
+            if node.type == 'TEX_IMAGE':
+                projection = node.projection
+                break
+        return mapping, projection
+        
+    def set_mapping_settings(mapping, projection):
+        """set the output of the Texture Coordinate node used by the mapping, and the projection of the images"""
+        PbrNodeTree.add_link("Texture Coordinate", int(mapping), "Mapping", 0)
+        for node in PbrNodeTree.nodes:
+            if node.type == 'TEX_IMAGE':
+                node.projection = projection
+        
+    def reconcile(material, images):
+        """update the node group of a material to use the given images, keeping the values of its inputs
+        
+        If the material already has a texture node for each map and no other, the nodes are only
+        pointed to the new images. Otherwise the content of the group is rebuilt."""
+        group_tree = material.node_tree.nodes["Group"].node_tree
+        texture_nodes = {node.name: node for node in group_tree.nodes if node.type == 'TEX_IMAGE'}
+        
+        # The roughness map is not used when there is a glossiness map (see add_roughness)
+        wanted = {MAP_NODES[map_type]: image for map_type, image in images.items()
+                  if map_type in MAP_NODES and not (map_type == 'Rou' and 'Glo' in images)}
+        
+        if set(wanted.keys()) != set(texture_nodes.keys()):
+            PbrNodeTree.IMAGES = images
+            PbrNodeTree.rebuild(material)
+        else:
+            for name, image in wanted.items():
+                node = texture_nodes[name]
+                if node.image != image:
+                    node.image = image
+        
+        record_material(material)
 
     def add_image_texture(image, name, location, color_space='NONE'):
         """add an image texture node"""
@@ -305,30 +885,12 @@ class PbrNodeTree:
         mapping = PbrNodeTree.nodes.new("ShaderNodeMapping")
         mapping.location = (-2000, 0)
         
-        # Create a Scale group to control the scale from the node group
-        scale_tree = bpy.data.node_groups.new(type="ShaderNodeTree", name="Scale")
-        scale_nodes = scale_tree.nodes
-
+        # Add the shared Scale group to control the scale from the node group
         scale_group = PbrNodeTree.ntree.nodes.new("ShaderNodeGroup")
-        scale_group.node_tree = scale_tree
+        scale_group.node_tree = get_scale_tree()
         scale_group.name = "Scale"
         scale_group.location = (-1500, 0)
-        scale_tree.inputs.new("NodeSocketVector", "Vector")
-        scale_tree.inputs.new("NodeSocketFloat", "Scale")
         scale_group.inputs[1].default_value = 1
-        scale_tree.outputs.new("NodeSocketVector", "Vector")
-        
-        input_node = scale_nodes.new("NodeGroupInput")
-        input_node.location = (-300, 0)
-        output_node = scale_nodes.new("NodeGroupOutput")
-        output_node.location = (300, 0)
-        mix_node = scale_nodes.new("ShaderNodeMixRGB")
-        mix_node.inputs[0].default_value = 1
-        mix_node.blend_type = 'MULTIPLY'
-        
-        scale_tree.links.new(input_node.outputs[0], mix_node.inputs[1])
-        scale_tree.links.new(input_node.outputs[1], mix_node.inputs[2])
-        scale_tree.links.new(mix_node.outputs[0], output_node.inputs[0])
         
         PbrNodeTree.add_link("Mapping", 0, "Scale", 0)
         PbrNodeTree.add_link("Texture Coordinate", int(bpy.context.scene.mft_props.mapping), "Mapping", 0)
@@ -341,7 +903,10 @@ class PbrNodeTree:
         
     def set_single_controller(type, name, node_name, node_input, default_value, min_value, max_value, update):
         """add a controller in the node group"""
-        group = bpy.context.active_object.active_material.node_tree.nodes["Group"]
+        if update:
+            group = bpy.context.active_object.active_material.node_tree.nodes["Group"]
+        else:
+            group = PbrNodeTree.pbr_group
         if node_name not in group.node_tree.nodes.keys():
             "there is no such node in the tree (the corresponding map has not been loaded)"
             return
@@ -396,6 +961,671 @@ class PbrNodeTree:
                 actions[extension](image)
 
 
+#--------------------------------------------------------------------------------------------------------
+# Pre-flight Scan
+#--------------------------------------------------------------------------------------------------------
+# The number of scanlines in each chunk of an EXR file, for each compression
+EXR_LINES_PER_CHUNK = {0: 1, 1: 1, 2: 1, 3: 16, 4: 32, 5: 16, 6: 32, 7: 32, 8: 32, 9: 256}
+
+# The format expected from the extension of a file
+FILE_FORMATS = {".png": "PNG", ".jpg": "JPEG", ".jpeg": "JPEG", ".exr": "OPEN_EXR"}
+
+# The thread pool used to scan the files, created the first time files are scanned
+thread_pool = None
+
+
+def get_thread_pool():
+    """return the thread pool used to scan the files"""
+    global thread_pool
+    if thread_pool is None:
+        from concurrent.futures import ThreadPoolExecutor
+        thread_pool = ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) * 4))
+    return thread_pool
+
+
+def read_png_header(data, result):
+    """read the size and format of a PNG file and check that it is complete"""
+    import struct
+    width, height, bit_depth, color_type = struct.unpack(">IIBB", data[16:26])
+    result.update(width=width, height=height, bit_depth=bit_depth,
+                  channels={0: 1, 2: 3, 3: 3, 4: 2, 6: 4}.get(color_type, 0))
+    if data[-8:-4] != b"IEND":
+        result["errors"].append("truncated PNG file")
+
+
+def read_jpeg_header(data, result):
+    """read the size and format of a JPEG file and check that it is complete"""
+    import struct
+    i = 2
+    scan = None
+    while i + 4 <= len(data):
+        if data[i] != 0xFF:
+            result["errors"].append("corrupted JPEG file")
+            return
+        marker = data[i + 1]
+        if marker == 0xFF or 0xD0 <= marker <= 0xD9 or marker == 0x01:
+            # Padding or marker without segment
+            i += 1 if marker == 0xFF else 2
+            continue
+        length = struct.unpack(">H", data[i + 2:i + 4])[0]
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            # Start of frame
+            bit_depth, height, width, channels = struct.unpack(">BHHB", data[i + 4:i + 10])
+            result.update(width=width, height=height, bit_depth=bit_depth, channels=channels)
+            if channels == 4:
+                result["errors"].append("CMYK JPEG files are not supported")
+        elif marker == 0xDA:
+            # Start of scan: the compressed data follows
+            scan = i + 2 + length
+            break
+        i += 2 + length
+    
+    # The end of image marker cannot appear in the compressed data, but metadata or another file
+    # may follow it: it is searched backwards from the end of the file
+    if "width" not in result:
+        result["errors"].append("corrupted JPEG file")
+    elif scan is None or data.rfind(b"\xff\xd9", scan) == -1:
+        result["errors"].append("truncated JPEG file")
+
+
+def read_exr_header(data, result):
+    """read the size and format of an EXR file and check that it is complete"""
+    import struct
+    version = struct.unpack("<I", data[4:8])[0]
+    attributes = {}
+    i = 8
+    while True:
+        end = data.find(b"\0", i)
+        if end == -1:
+            result["errors"].append("truncated EXR header")
+            return
+        if end == i:
+            # An empty name ends the header
+            i += 1
+            break
+        name = data[i:end]
+        type_end = data.find(b"\0", end + 1)
+        size = struct.unpack("<i", data[type_end + 1:type_end + 5])[0]
+        attributes[name] = data[type_end + 5:type_end + 5 + size]
+        i = type_end + 5 + size
+    
+    if b"dataWindow" not in attributes or b"channels" not in attributes:
+        result["errors"].append("incomplete EXR header")
+        return
+    xmin, ymin, xmax, ymax = struct.unpack("<iiii", attributes[b"dataWindow"])
+    
+    # The list of channels: name, pixel type (0: uint, 1: half, 2: float), flags and sampling of each channel
+    channels, pixel_type, channel_list, j = 0, 1, attributes[b"channels"], 0
+    while j < len(channel_list) and channel_list[j] != 0:
+        j = channel_list.find(b"\0", j) + 1
+        pixel_type = struct.unpack("<i", channel_list[j:j + 4])[0]
+        channels += 1
+        j += 16
+    result.update(width=xmax - xmin + 1, height=ymax - ymin + 1, channels=channels, bit_depth=16 if pixel_type == 1 else 32)
+    
+    # The offsets of the chunks follow the header of single part scanline files: they must all be in the file
+    if version & 0x1a00 or b"compression" not in attributes:
+        return
+    lines = EXR_LINES_PER_CHUNK.get(attributes[b"compression"][0], 1)
+    chunks = (result["height"] + lines - 1) // lines
+    if i + chunks * 8 > len(data):
+        result["errors"].append("truncated EXR file")
+        return
+    offsets = struct.unpack("<%dQ" % chunks, data[i:i + chunks * 8])
+    last = max(offsets)
+    if min(offsets) < i + chunks * 8 or last + 8 > len(data) \
+            or last + 8 + struct.unpack("<i", data[last + 4:last + 8])[0] > len(data):
+        result["errors"].append("truncated EXR file")
+
+
+def scan_file(path):
+    """read the header of an image file and return its size, format and problems"""
+    import mmap
+    result = {"file": path, "errors": [], "warnings": []}
+    try:
+        with open(path, 'rb') as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                result["errors"].append("empty file")
+                return result
+            # Only the pages of the file that are actually read are loaded
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                if data[:8] == b"\x89PNG\r\n\x1a\n":
+                    result["format"] = "PNG"
+                    read_png_header(data, result)
+                elif data[:2] == b"\xff\xd8":
+                    result["format"] = "JPEG"
+                    read_jpeg_header(data, result)
+                elif data[:4] == b"\x76\x2f\x31\x01":
+                    result["format"] = "OPEN_EXR"
+                    read_exr_header(data, result)
+                elif os.path.splitext(path)[1].lower() not in FILE_FORMATS:
+                    result["warnings"].append("format not checked")
+            finally:
+                data.close()
+    except Exception as error:
+        result["errors"].append("unreadable file: " + str(error))
+        return result
+    
+    expected_format = FILE_FORMATS.get(os.path.splitext(path)[1].lower())
+    if expected_format is not None and result.get("format") != expected_format:
+        result["errors"].append("not a valid %s file" % expected_format.replace("OPEN_", ""))
+    return result
+
+
+def scan_sets(texture_sets, settings):
+    """scan the files of the texture sets in parallel and check each set
+    
+    Return a report which can be written as JSON: the results of each set and file, and whether all the sets are valid."""
+    paths = [os.path.join(directory, file) for directory, files in texture_sets for file in files]
+    results = dict(zip(paths, get_thread_pool().map(scan_file, paths)))
+    
+    report = {"sets": [], "valid": True}
+    for directory, files in texture_sets:
+        set_report = {"directory": directory, "files": [], "errors": [], "warnings": []}
+        sizes = set()
+        tiles = {}
+        for file in files:
+            result = results[os.path.join(directory, file)]
+            map_type = get_map_type(file, settings)
+            if map_type == 'Nor' and result.get("format") == "PNG" and result.get("bit_depth") == 16:
+                result["warnings"].append("16 bit PNG normal map, loaded as a float image")
+            match = UDIM_PATTERN.match(file)
+            if map_type is not None and match:
+                tiles.setdefault(map_type, {})[int(match.group(1))] = file
+            if "width" in result:
+                sizes.add((result["width"], result["height"]))
+            set_report["errors"].extend(file + ": " + error for error in result["errors"])
+            set_report["warnings"].extend(file + ": " + warning for warning in result["warnings"])
+            set_report["files"].append(result)
+        
+        if len(sizes) > 1:
+            set_report["warnings"].append("mismatched resolutions: " + ", ".join("%dx%d" % size for size in sorted(sizes)))
+        for map_tiles in tiles.values():
+            warning = get_tiles_warning(map_tiles)
+            if warning is not None:
+                set_report["warnings"].append(warning)
+        set_report["valid"] = not set_report["errors"]
+        report["valid"] = report["valid"] and set_report["valid"]
+        report["sets"].append(set_report)
+    return report
+
+
+def write_report(report, path):
+    """write a scan report as a JSON file"""
+    import json
+    with open(path, 'w') as report_file:
+        json.dump(report, report_file, indent=2)
+
+
+#--------------------------------------------------------------------------------------------------------
+# Batch Import
+#--------------------------------------------------------------------------------------------------------
+def find_texture_sets(library_dir):
+    """find the texture sets of a library: each directory containing images is a set"""
+    extensions = tuple(bpy.path.extensions_image)
+    texture_sets = []
+    for root, dirs, files in os.walk(library_dir):
+        dirs[:] = sorted(dir for dir in dirs if dir != NORMAL_CACHE_DIR)
+        images = sorted(file for file in files if file.lower().endswith(extensions))
+        if images:
+            texture_sets.append((root, images))
+    return texture_sets
+
+
+def split_shards(texture_sets, count):
+    """distribute the texture sets between the workers so that each one loads about the same amount of data"""
+    sizes = [sum(os.path.getsize(os.path.join(directory, file)) for file in files) for directory, files in texture_sets]
+    shards = [[] for i in range(count)]
+    loads = [0] * count
+    
+    # The biggest sets are distributed first, each one to the least loaded worker
+    for size, texture_set in sorted(zip(sizes, texture_sets), key=lambda item: item[0], reverse=True):
+        i = loads.index(min(loads))
+        shards[i].append(texture_set)
+        loads[i] += size
+    return [shard for shard in shards if shard]
+
+
+def get_material_names(texture_sets):
+    """give each texture set the name of its material
+    
+    When several sets give the same name, the name of their directory is appended to all but the first one,
+    in the order of the library, so that the names don't depend on how the sets are split between the workers."""
+    names = {}
+    used = set()
+    for directory, files in texture_sets:
+        name = get_material_name(files).strip() or os.path.basename(os.path.normpath(directory))
+        if name in used:
+            name += " (" + os.path.basename(os.path.normpath(directory)) + ")"
+        used.add(name)
+        names[directory] = name
+    return names
+
+
+def blender_command(*args):
+    """the command line to run this file in a background Blender process"""
+    # Without --python-exit-code, Blender exits with 0 even when the script fails
+    return [bpy.app.binary_path, "--background", "--factory-startup", "--python-exit-code", "1",
+            "--python", os.path.abspath(__file__), "--"] + list(args)
+
+
+def run_farm(library_dir, output_path, settings, workers, mapping='2', projection='FLAT'):
+    """import a whole texture library into a .blend file using several background Blender processes
+    
+    Each worker builds the materials of its shard of the library into its own .blend file,
+    then all the shards are merged into the output file. Return the number of texture sets
+    and the number of workers which failed. The sets with broken files are skipped, and listed in
+    the report of the pre-flight scan written next to the output file. Raise an error if the shards
+    could not be merged."""
+    import json
+    import shutil
+    import subprocess
+    import tempfile
+    
+    texture_sets = find_texture_sets(library_dir)
+    
+    # Check the files first, so that the workers don't waste time on broken sets
+    report = scan_sets(texture_sets, settings)
+    write_report(report, os.path.splitext(output_path)[0] + "_preflight.json")
+    texture_sets = [texture_set for texture_set, set_report in zip(texture_sets, report["sets"]) if set_report["valid"]]
+    if not texture_sets:
+        return 0, 0
+    
+    names = get_material_names(texture_sets)
+    work_dir = tempfile.mkdtemp(prefix="mft_farm_")
+    processes = []
+    try:
+        for i, shard in enumerate(split_shards(texture_sets, workers)):
+            spec_path = os.path.join(work_dir, "shard_%d.json" % i)
+            shard_path = os.path.join(work_dir, "shard_%d.blend" % i)
+            with open(spec_path, 'w') as spec_file:
+                json.dump({
+                    "sets": shard,
+                    "names": {directory: names[directory] for directory, files in shard},
+                    "settings": settings,
+                    "mapping": mapping,
+                    "projection": projection,
+                    "output": shard_path
+                }, spec_file)
+            processes.append((subprocess.Popen(blender_command("--farm-worker", spec_path)), shard_path))
+        
+        shard_paths = []
+        failed = 0
+        for process, shard_path in processes:
+            if process.wait() == 0 and os.path.exists(shard_path):
+                shard_paths.append(shard_path)
+            else:
+                failed += 1
+        
+        if shard_paths:
+            # The shards are merged in the work directory, so that a failed merge cannot leave
+            # an older output file which would look like a success
+            merged_path = os.path.join(work_dir, "merged.blend")
+            subprocess.check_call(blender_command("--farm-merge", merged_path, *shard_paths))
+            if not os.path.exists(merged_path):
+                raise RuntimeError("the merge of the shards did not write any file")
+            shutil.move(merged_path, os.path.abspath(output_path))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    
+    return len(texture_sets), failed
+
+
+def write_library(path, datablocks):
+    """write the datablocks in a .blend file, keeping the absolute paths of the images"""
+    if bpy.app.version < (2, 80, 0):
+        bpy.data.libraries.write(path, datablocks, relative_remap=False, fake_user=True)
+    else:
+        bpy.data.libraries.write(path, datablocks, path_remap='ABSOLUTE', fake_user=True)
+
+
+def farm_worker(spec_path):
+    """build the materials of a shard of the library and write them in a .blend file"""
+    import json
+    with open(spec_path) as spec_file:
+        spec = json.load(spec_file)
+    
+    bpy.utils.register_class(PBRMaterialProperties)
+    bpy.types.Scene.mft_props = bpy.props.PointerProperty(type=PBRMaterialProperties)
+    bpy.context.scene.mft_props.mapping = spec["mapping"]
+    bpy.context.scene.mft_props.projection = spec["projection"]
+    
+    materials = set()
+    for directory, files in spec["sets"]:
+        try:
+            images = load_images([os.path.join(directory, file) for file in files], spec["settings"])
+            if not images:
+                continue
+            
+            material = bpy.data.materials.new(name=spec["names"][directory])
+            material.use_nodes = True
+            tag_material(material, directory, files)
+            
+            PbrNodeTree.init(material.name, material)
+            PbrNodeTree.IMAGES = images
+            PbrNodeTree.fill_tree()
+            PbrNodeTree.set_controllers()
+            record_material(material)
+            materials.add(material)
+        except Exception as error:
+            # A broken texture set should not make the whole shard fail
+            print("Skipping texture set " + directory + ": " + str(error))
+    
+    if not materials:
+        # Let the coordinator know that the whole shard failed rather than writing an empty file
+        raise RuntimeError("no material could be built from the shard " + spec_path)
+    write_library(spec["output"], materials)
+
+
+def farm_merge(output_path, shard_paths):
+    """gather the materials of all the shards in a single .blend file"""
+    materials = set()
+    for shard_path in shard_paths:
+        # The names of the materials are unique across the shards (see get_material_names)
+        with bpy.data.libraries.load(shard_path) as (data_from, data_to):
+            data_to.materials = data_from.materials
+        materials.update(material for material in data_to.materials if material is not None)
+    
+    # Each shard brought its own copy of the shared Scale group, the materials must use a single one
+    scale_tree = get_scale_tree()
+    for node_group in list(bpy.data.node_groups):
+        if node_group != scale_tree and node_group.get("mft_version") == SCALE_TREE_VERSION:
+            node_group.user_remap(scale_tree)
+            bpy.data.node_groups.remove(node_group)
+    
+    write_library(output_path, materials)
+
+
+def farm_main(argv):
+    """entry point of the batch import from the command line:
+    
+    blender --background --python-exit-code 1 --python pbr_material_from_textures.py -- --farm LIBRARY_DIR OUTPUT.blend [WORKERS]"""
+    command, args = argv[0], argv[1:]
+    if command == "--farm-worker":
+        farm_worker(args[0])
+    elif command == "--farm-merge":
+        farm_merge(args[0], args[1:])
+    else:
+        workers = int(args[2]) if len(args) > 2 else os.cpu_count()
+        count, failed = run_farm(args[0], args[1], dict(DEFAULT_SUFFIXES, detect_normal_format=True, normal_cache_directory=""), workers)
+        print("Imported %d texture sets, %d workers failed" % (count, failed))
+        if failed:
+            sys.exit(1)
+
+
+#--------------------------------------------------------------------------------------------------------
+# Inventory
+#--------------------------------------------------------------------------------------------------------
+def record_material(material):
+    """store in the material the workflow and the maps of its node group, for the inventory"""
+    group_tree = material.node_tree.nodes["Group"].node_tree
+    maps = {node.name: node.image.filepath if node.image is not None else ""
+            for node in group_tree.nodes if node.type == 'TEX_IMAGE'}
+    workflow = 'SG' if "Specular" in maps or "Glossiness" in maps else 'MR'
+    record = {"workflow": workflow, "maps": maps}
+    if material.get("mft") is None or material["mft"].to_dict() != record:
+        material["mft"] = record
+
+
+def get_inventory_entry(material):
+    """return the entry of a material in the inventory: its record, displacement method and node group"""
+    entry = material["mft"].to_dict()
+    entry["microdisp"] = material.cycles.displacement_method != 'BUMP'
+    group = get_pbr_group(material)
+    entry["group"] = group.node_tree.name if group is not None else ""
+    return entry
+
+
+def refresh_inventory(scene):
+    """index all the PBR materials of the file in the scene, with their workflow, maps and displacement method"""
+    scene["mft_inventory"] = {material.name: get_inventory_entry(material)
+                              for material in bpy.data.materials if material.get("mft") is not None}
+    scene["mft_inventory_count"] = len(bpy.data.materials)
+
+
+def update_inventory_entry(inventory, material):
+    """read the maps of an updated material again and change its entry in the inventory if they changed"""
+    if get_pbr_group(material) is not None:
+        # The images of the maps may have been changed, or maps removed, since the material was generated
+        record_material(material)
+    entry = get_inventory_entry(material)
+    if inventory[material.name].to_dict() != entry:
+        inventory[material.name] = entry
+
+
+def find_pbr_materials(scene, workflow=None, microdisp=None):
+    """return the names of the PBR materials of the inventory, optionally only those of a workflow ('MR' or 'SG')
+    or with or without microdisplacement"""
+    inventory = scene.get("mft_inventory", {})
+    return [name for name, entry in inventory.items()
+            if (workflow is None or entry["workflow"] == workflow)
+            and (microdisp is None or bool(entry["microdisp"]) == microdisp)]
+
+
+@persistent
+def update_inventory(scene, depsgraph=None):
+    """refresh the inventory when materials have been added, removed or modified
+    
+    Only the entries of the modified materials are updated: the whole file is only indexed again
+    when materials are added, removed or renamed."""
+    inventory = scene.get("mft_inventory")
+    if inventory is None or scene.get("mft_inventory_count") != len(bpy.data.materials):
+        refresh_inventory(scene)
+        return
+    
+    if depsgraph is not None:
+        names = set()
+        node_trees = set()
+        for update in depsgraph.updates:
+            if isinstance(update.id, bpy.types.Material):
+                names.add(update.id.name)
+            elif isinstance(update.id, bpy.types.NodeTree):
+                node_trees.add(update.id.name)
+        if node_trees:
+            names.update(name for name, entry in inventory.items() if entry.get("group") in node_trees)
+    elif bpy.data.materials.is_updated or bpy.data.node_groups.is_updated:
+        # Before 2.80 there is no list of the updated datablocks: only the flags of the indexed materials are read
+        names = set()
+        for name, entry in inventory.items():
+            material = bpy.data.materials.get(name)
+            group_tree = bpy.data.node_groups.get(entry.get("group", ""))
+            if material is None or material.is_updated or (group_tree is not None and group_tree.is_updated):
+                names.add(name)
+    else:
+        return
+    
+    for name in names:
+        material = bpy.data.materials.get(name)
+        if material is None or (name in inventory) != (material.get("mft") is not None):
+            # A material was renamed, or became or stopped being a PBR material
+            refresh_inventory(scene)
+            return
+        if name in inventory:
+            update_inventory_entry(inventory, material)
+
+
+def get_update_handlers():
+    """return the handlers called after each update of the scene"""
+    if hasattr(bpy.app.handlers, "depsgraph_update_post"):
+        return bpy.app.handlers.depsgraph_update_post
+    return bpy.app.handlers.scene_update_post
+
+
+#--------------------------------------------------------------------------------------------------------
+# Material Description
+#--------------------------------------------------------------------------------------------------------
+# The version of the material description format, to increment when it changes
+DESCRIPTION_VERSION = 1
+
+
+def get_image_paths(image):
+    """return the absolute paths of the files of an image
+    
+    The normal maps converted to the OpenGL convention are described with their original files."""
+    if image.get("mft_original"):
+        return image["mft_original"].split(';')
+    return [bpy.path.abspath(image.filepath)]
+
+
+def describe_material(material):
+    """return the description of a PBR material: its maps, mapping, projection and the values of its controllers"""
+    group = get_pbr_group(material)
+    node_types = {node_name: map_type for map_type, node_name in MAP_NODES.items()}
+    
+    maps = {}
+    for node in group.node_tree.nodes:
+        if node.type == 'TEX_IMAGE' and node.name in node_types:
+            maps[node_types[node.name]] = get_image_paths(node.image) if node.image is not None else []
+    mapping, projection = PbrNodeTree.get_mapping_settings(group.node_tree)
+    
+    return {
+        "name": material.name,
+        "workflow": 'SG' if 'Spec' in maps or 'Glo' in maps else 'MR',
+        "maps": maps,
+        "mapping": mapping,
+        "projection": projection,
+        "controllers": {socket.name: socket.default_value for socket in group.inputs}
+    }
+
+
+def check_description(description):
+    """raise a ValueError if a material description is incomplete or invalid"""
+    if not isinstance(description, dict):
+        raise ValueError("not a material description")
+    for key, kind in (("name", str), ("maps", dict), ("mapping", str), ("projection", str), ("controllers", dict)):
+        if not isinstance(description.get(key), kind):
+            raise ValueError("missing or invalid %s" % key)
+    
+    if description["mapping"] not in [item[0] for item in MAPPINGS]:
+        raise ValueError("invalid mapping " + description["mapping"])
+    if description["projection"] not in [item[0] for item in PROJECTIONS]:
+        raise ValueError("invalid projection " + description["projection"])
+    for map_type, paths in description["maps"].items():
+        if map_type not in MAP_NODES or not isinstance(paths, list) or not all(isinstance(path, str) for path in paths):
+            raise ValueError("invalid map " + map_type)
+    for name, value in description["controllers"].items():
+        if not isinstance(value, (int, float)):
+            raise ValueError("invalid value of " + name)
+
+
+def load_description_image(paths, image_cache, missing_files, warnings):
+    """load the image of a map from the paths of its files, sharing the images already loaded
+    
+    Return None and add the paths to the missing files if the image cannot be loaded."""
+    if not paths:
+        return None
+    key = tuple(paths)
+    if key not in image_cache:
+        tiles = {}
+        for path in paths:
+            match = UDIM_PATTERN.match(os.path.basename(path))
+            tiles[int(match.group(1)) if match else None] = path
+        try:
+            if len(paths) > 1 and None not in tiles:
+                image_cache[key] = load_first_tile(tiles, warnings)
+            else:
+                image_cache[key] = bpy.data.images.load(paths[0], check_existing=True)
+        except RuntimeError:
+            image_cache[key] = None
+            missing_files.extend(paths)
+    return image_cache[key]
+
+
+def tag_described_material(material, description):
+    """remember the files of a material built from a description, so that it can be refreshed later"""
+    paths = [path for paths in description["maps"].values() for path in paths]
+    if not paths:
+        return
+    try:
+        directory = os.path.commonpath([os.path.dirname(path) for path in paths])
+        file_names = [os.path.relpath(path, directory) for path in paths]
+    except ValueError:
+        # The files are on different drives: the absolute paths are kept
+        directory, file_names = "", paths
+    tag_material(material, directory, file_names)
+
+
+def build_material(description, settings, image_cache, missing_files, warnings):
+    """create a PBR material from its description
+    
+    Raise a ValueError if the description is invalid. The maps whose files cannot be loaded
+    are left without image, and their files are added to the missing files. The problems which
+    don't prevent the maps from loading are added to the warnings."""
+    check_description(description)
+    maps = dict(description["maps"])
+    
+    # The normal map goes through the same conversion as when the files are imported
+    normal_tiles = None
+    if maps.get('Nor') and all(os.path.exists(path) for path in maps['Nor']):
+        normal_tiles = {}
+        for path in maps['Nor']:
+            match = UDIM_PATTERN.match(os.path.basename(path))
+            normal_tiles[int(match.group(1)) if match and len(maps['Nor']) > 1 else None] = path
+        converted = get_opengl_normal_paths(normal_tiles, settings)
+        if converted is normal_tiles:
+            normal_tiles = None
+        else:
+            maps['Nor'] = [converted[number] for number in sorted(converted.keys(), key=lambda number: number or 0)]
+    
+    images = {map_type: load_description_image(paths, image_cache, missing_files, warnings)
+              for map_type, paths in maps.items()}
+    if normal_tiles is not None and images['Nor'] is not None:
+        tag_converted_normal(images['Nor'], normal_tiles)
+    
+    material = bpy.data.materials.new(name=description["name"])
+    material.use_nodes = True
+    
+    try:
+        PbrNodeTree.init(material.name, material)
+        PbrNodeTree.IMAGES = images
+        PbrNodeTree.fill_tree()
+        PbrNodeTree.set_controllers()
+        
+        PbrNodeTree.set_mapping_settings(description["mapping"], description["projection"])
+        
+        inputs = PbrNodeTree.pbr_group.inputs
+        for name, value in description["controllers"].items():
+            if name in inputs.keys():
+                inputs[name].default_value = value
+    except Exception:
+        # Don't leave a half-built material behind
+        group = get_pbr_group(material)
+        if group is not None:
+            bpy.data.node_groups.remove(group.node_tree)
+        bpy.data.materials.remove(material)
+        raise
+    
+    tag_described_material(material, description)
+    record_material(material)
+    return material
+
+
+def write_descriptions(materials, path):
+    """write the description of the materials in a JSON file"""
+    import json
+    with open(path, 'w') as description_file:
+        json.dump({
+            "format": "pbr_material_from_textures",
+            "version": DESCRIPTION_VERSION,
+            "materials": [describe_material(material) for material in materials]
+        }, description_file, indent=2)
+
+
+def read_descriptions(path):
+    """read the descriptions of materials from a JSON file"""
+    import json
+    with open(path) as description_file:
+        data = json.load(description_file)
+    if not isinstance(data, dict):
+        raise ValueError("not a material description")
+    if data.get("format") != "pbr_material_from_textures" or data.get("version", 0) > DESCRIPTION_VERSION:
+        raise ValueError("not a material description of a supported version")
+    if not isinstance(data.get("materials"), list):
+        raise ValueError("no list of materials")
+    return data["materials"]
+
+
 #--------------------------------------------------------------------------------------------------------
 # Panel
 #--------------------------------------------------------------------------------------------------------
@@ -424,9 +1654,15 @@ class MaterialPanel(bpy.types.Panel):
         col.scale_y = 2
         col.operator("mft.new_pbr_sg_material", text="Specular / Glossiness")
     
-        if not (context.active_object.active_material is None or context.active_object.active_material.node_tree is None):
+        material = context.active_object.active_material
+        if not (material is None or material.node_tree is None):
             mft_props = context.scene.mft_props
-            ntree = context.active_object.active_material.node_tree
+            
+            # Content of the material, as recorded when it was generated
+            record = material.get("mft")
+            if record is not None:
+                workflow = "Specular / Glossiness" if record["workflow"] == 'SG' else "Metalness / Roughness"
+                layout.label("%s, %d maps" % (workflow, len(record["maps"])), icon="MATERIAL")
             
             # Mapping
             box = layout.box()
@@ -442,11 +1678,30 @@ class MaterialPanel(bpy.types.Panel):
             col.label("Projection:")
             col.prop(mft_props, 'projection', text="")
             
+            box.prop(mft_props, 'use_global_mapping')
+            if mft_props.use_global_mapping:
+                box.row().prop(mft_props, 'global_scale')
+                box.row().prop(mft_props, 'global_offset', text="")
+            
             # Reset
             row = layout.row()
             row.scale_y = 2
             row.operator("mft.reset_group", text="Reset Material", icon="FILE_REFRESH")
         
+        # Refresh
+        row = layout.row()
+        row.operator("mft.refresh_materials", text="Refresh PBR materials", icon="FILE_REFRESH")
+        
+        # Material description
+        row = layout.row(align=True)
+        row.operator("mft.export_description", text="Export description", icon="EXPORT")
+        row.operator("mft.import_description", text="Import description", icon="IMPORT")
+        
+        # Batch import
+        row = layout.row(align=True)
+        row.operator("mft.batch_import", text="Batch import library", icon="FILE_FOLDER")
+        row.operator("mft.preflight_scan", text="Scan library", icon="VIEWZOOM")
+        
         # Delete unused data
         row = layout.row()
         row.operator("mft.delete_unused_data", text="Delete unused data", icon="OUTLINER_DATA_EMPTY")
@@ -470,15 +1725,43 @@ class ImportTexturesAsMaterial(Operator, ImportHelper):
 
     filename_ext = "*" + ";*".join(bpy.path.extensions_image)
 
+    update_existing = BoolProperty(name="Update Active Material", default=False,
+                                   description="Replace the maps of the active PBR material instead of creating a new one, keeping its settings")
+
     def execute(self, context):
+        prefs = context.user_preferences.addons['pbr_material_from_textures'].preferences
+        warnings = []
+        if prefs.preflight_scan:
+            report = scan_sets([(self.directory, [file.name for file in self.files])], get_import_settings(prefs))
+            set_report = report["sets"][0]
+            warnings.extend(set_report["warnings"])
+            if not set_report["valid"]:
+                self.report({'ERROR'}, "; ".join(set_report["errors"]))
+                return {'CANCELLED'}
+        
+        # Retrieve the images and their extension (type)
+        try:
+            images = self.sort_files(context, self.files, self.directory, warnings)
+        except RuntimeError as error:
+            self.report({'ERROR'}, str(error))
+            return {'CANCELLED'}
+        if warnings:
+            # The pre-flight scan and the loading can warn about the same tiles
+            self.report({'WARNING'}, "; ".join(sorted(set(warnings), key=warnings.index)))
+        file_names = [file.name for file in self.files]
+        
+        material = context.active_object.active_material
+        if self.update_existing and get_pbr_group(material) is not None:
+            PbrNodeTree.reconcile(material, images)
+            tag_material(material, self.directory, file_names)
+            return {'FINISHED'}
+        
         # Create a new material
         material_name = self.get_material_name()
         new_material = bpy.data.materials.new(name=material_name)
         new_material.use_nodes = True
+        tag_material(new_material, self.directory, file_names)
         bpy.context.active_object.active_material = new_material
-
-        # Retrieve the images and their extension (type)
-        images = self.sort_files(context, self.files, self.directory)                
         
         # Set the color map property (Diffuse or Albedo) if there is only one color map
         self.set_color_map(images)
@@ -488,58 +1771,18 @@ class ImportTexturesAsMaterial(Operator, ImportHelper):
         PbrNodeTree.IMAGES = images
         PbrNodeTree.fill_tree()
         PbrNodeTree.set_controllers()
+        record_material(new_material)
         
         return {'FINISHED'}
     
     def get_material_name(self):
         """find the name of the material based on the textures name"""
-        name1 = self.files[0].name.split('_')
-        name2 = self.files[-1].name.split('_')
-        intersection = set(name1).intersection(name2)
-        name = ""
-        for elt in intersection:
-            elt = elt[0].upper() + elt[1:].lower()
-            if "k" in elt:
-                # there is the resolution of the texture, we don't want it
-                continue
-            name += " " + elt
-        return name
+        return get_material_name([file.name for file in self.files])
     
-    def sort_files(self, context, files, directory):
+    def sort_files(self, context, files, directory, warnings=None):
         """find the type (Diffuse, etc) of each map and return a dictionnary with each map associated to a type"""
-        images = {}
         prefs = context.user_preferences.addons['pbr_material_from_textures'].preferences
-        suffixes = {
-            'diffuse_suffixes': 'Col',
-            'albedo_suffixes': 'Col',
-            'ao_suffixes': 'AO', 
-            'roughness_suffixes': 'Rou', 
-            'glossiness_suffixes': 'Glo', 
-            'normal_suffixes': 'Nor', 
-            'bump_suffixes': 'Bum', 
-            'height_suffixes': 'Dis', 
-            'metallic_suffixes': 'Met',
-            'specular_suffixes': 'Spec'
-        }
-        for file in files:
-            path = directory + file.name
-            print("Loading file: " + file.name)
-            image = bpy.data.images.load(path, check_existing=True)
-            name_list = image.name.split('.')[0].split('_')
-                    
-            # We browse the name parts until we find the texture type
-            i = 1
-            found = False
-            while i < len(name_list) + 1 and not found:
-                extension = name_list[-i]
-                for type in suffixes.keys():
-                    if extension in prefs[type].split(';'):
-                        suffix = suffixes[type]
-                        images[suffix] = image
-                        found = True
-                        break
-                i += 1
-        return images
+        return load_images([directory + file.name for file in files], get_import_settings(prefs), warnings)
 
     def set_color_map(self, images):
         """ Set the color map property (Diffuse or Albedo) """
@@ -555,6 +1798,147 @@ class ImportTexturesAsMaterial(Operator, ImportHelper):
             bpy.context.scene.mft_props.color_map = 'ALB'
     
     
+class BatchImportLibrary(Operator, ExportHelper):
+    """Import every texture set of a library as a material in a .blend file, using several background Blender processes.
+Blender is busy until the whole library is imported"""
+    bl_idname = "mft.batch_import"
+    bl_label = "Batch Import Library"
+    bl_options = {'REGISTER'}
+    
+    filename_ext = ".blend"
+    filter_glob = StringProperty(default="*.blend", options={'HIDDEN'})
+    
+    library_directory = StringProperty(name="Library", description="Directory containing the texture sets, one per sub-directory", subtype='DIR_PATH')
+    workers = IntProperty(name="Workers", description="Number of Blender processes building the materials", default=os.cpu_count() or 1, min=1)
+    
+    def execute(self, context):
+        if not os.path.isdir(bpy.path.abspath(self.library_directory)):
+            self.report({'ERROR'}, "Select the directory of the texture library")
+            return {'CANCELLED'}
+        
+        import subprocess
+        prefs = context.user_preferences.addons['pbr_material_from_textures'].preferences
+        mft_props = context.scene.mft_props
+        try:
+            count, failed = run_farm(bpy.path.abspath(self.library_directory), self.filepath, get_import_settings(prefs),
+                                     self.workers, mft_props.mapping, mft_props.projection)
+        except (subprocess.CalledProcessError, OSError, RuntimeError) as error:
+            self.report({'ERROR'}, "The batch import failed: " + str(error))
+            return {'CANCELLED'}
+        
+        if failed:
+            self.report({'WARNING'}, "%d of the workers failed, some texture sets are missing" % failed)
+        else:
+            self.report({'INFO'}, "%d texture sets imported in %s" % (count, self.filepath))
+        return {'FINISHED'}
+    
+    
+class PreflightScan(Operator, ExportHelper):
+    """Check the texture files of a library without loading them, and write a JSON report"""
+    bl_idname = "mft.preflight_scan"
+    bl_label = "Scan Texture Library"
+    bl_options = {'REGISTER'}
+    
+    filename_ext = ".json"
+    filter_glob = StringProperty(default="*.json", options={'HIDDEN'})
+    
+    library_directory = StringProperty(name="Library", description="Directory containing the texture sets, one per sub-directory", subtype='DIR_PATH')
+    
+    def execute(self, context):
+        library_directory = bpy.path.abspath(self.library_directory)
+        if not os.path.isdir(library_directory):
+            self.report({'ERROR'}, "Select the directory of the texture library")
+            return {'CANCELLED'}
+        
+        prefs = context.user_preferences.addons['pbr_material_from_textures'].preferences
+        report = scan_sets(find_texture_sets(library_directory), get_import_settings(prefs))
+        write_report(report, self.filepath)
+        
+        invalid = len([set_report for set_report in report["sets"] if not set_report["valid"]])
+        if invalid:
+            self.report({'WARNING'}, "%d of %d texture sets have broken files, see %s" % (invalid, len(report["sets"]), self.filepath))
+        else:
+            self.report({'INFO'}, "%d texture sets checked" % len(report["sets"]))
+        return {'FINISHED'}
+    
+    
+class ExportMaterialDescription(Operator, ExportHelper):
+    """Save the description of PBR materials in a JSON file, to rebuild them in another file"""
+    bl_idname = "mft.export_description"
+    bl_label = "Export Material Description"
+    bl_options = {'REGISTER'}
+    
+    filename_ext = ".json"
+    filter_glob = StringProperty(default="*.json", options={'HIDDEN'})
+    
+    all_materials = BoolProperty(name="All PBR Materials", description="Export all the PBR materials of the file instead of the active one", default=False)
+    
+    def execute(self, context):
+        if self.all_materials:
+            materials = [bpy.data.materials.get(name) for name in find_pbr_materials(context.scene)]
+        else:
+            materials = [context.active_object.active_material] if context.active_object is not None else []
+        materials = [material for material in materials if get_pbr_group(material) is not None]
+        
+        if not materials:
+            self.report({'ERROR'}, "No PBR material to export")
+            return {'CANCELLED'}
+        
+        write_descriptions(materials, self.filepath)
+        self.report({'INFO'}, "%d materials exported" % len(materials))
+        return {'FINISHED'}
+    
+    
+class ImportMaterialDescription(Operator, ImportHelper):
+    """Create PBR materials from the descriptions of a JSON file"""
+    bl_idname = "mft.import_description"
+    bl_label = "Import Material Description"
+    bl_options = {'REGISTER', 'UNDO'}
+    
+    filename_ext = ".json"
+    filter_glob = StringProperty(default="*.json", options={'HIDDEN'})
+    
+    use_fake_user = BoolProperty(name="Fake User", description="Keep the materials in the file even if no object uses them", default=True)
+    
+    def execute(self, context):
+        try:
+            descriptions = read_descriptions(self.filepath)
+        except (IOError, ValueError, KeyError) as error:
+            self.report({'ERROR'}, "Cannot read " + self.filepath + ": " + str(error))
+            return {'CANCELLED'}
+        
+        prefs = context.user_preferences.addons['pbr_material_from_textures'].preferences
+        settings = get_import_settings(prefs)
+        
+        # The images used by several materials are loaded only once
+        image_cache = {}
+        materials = []
+        failures = []
+        missing_files = []
+        warnings = []
+        for i, description in enumerate(descriptions):
+            try:
+                material = build_material(description, settings, image_cache, missing_files, warnings)
+            except (ValueError, RuntimeError) as error:
+                name = description.get("name", "#%d" % (i + 1)) if isinstance(description, dict) else "#%d" % (i + 1)
+                failures.append("%s: %s" % (name, error))
+                continue
+            material.use_fake_user = self.use_fake_user
+            materials.append(material)
+        
+        if materials and context.active_object is not None:
+            context.active_object.active_material = materials[0]
+        
+        if failures:
+            self.report({'WARNING'}, "%d materials skipped: %s" % (len(failures), "; ".join(failures)))
+        if missing_files:
+            self.report({'WARNING'}, "%d files not found, their maps have no image: %s" % (len(missing_files), "; ".join(missing_files)))
+        if warnings:
+            self.report({'WARNING'}, "; ".join(warnings))
+        self.report({'INFO'}, "%d materials imported" % len(materials))
+        return {'FINISHED'}
+    
+    
 class CreateEmptyMrMaterial(Operator):
     """Create a PBR node tree with Metallic/Roughness maps without images"""
     bl_idname = "mft.new_pbr_mr_material"
@@ -579,6 +1963,7 @@ class CreateEmptyMrMaterial(Operator):
         PbrNodeTree.add_normal(None)
         
         PbrNodeTree.set_controllers()
+        record_material(new_material)
     
         return {'FINISHED'}
     
@@ -607,7 +1992,44 @@ class CreateEmptySgMaterial(Operator):
         PbrNodeTree.add_normal(None)
         
         PbrNodeTree.set_controllers()
+        record_material(new_material)
+        
+        return {'FINISHED'}
+    
+    
+class RefreshMaterials(Operator):
+    """Reload the textures of all the PBR materials and update their node groups, keeping their settings"""
+    bl_idname = "mft.refresh_materials"
+    bl_label = "Refresh PBR Materials"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    def execute(self, context):
+        prefs = context.user_preferences.addons['pbr_material_from_textures'].preferences
+        settings = get_import_settings(prefs)
+        
+        count = 0
+        warnings = []
+        for name in find_pbr_materials(context.scene):
+            material = bpy.data.materials.get(name)
+            if get_pbr_group(material) is None or "mft_files" not in material.keys():
+                continue
+            paths = [os.path.join(material["mft_source"], file) for file in material["mft_files"].split(';')]
+            try:
+                images = load_images([path for path in paths if os.path.exists(path)], settings, warnings)
+            except RuntimeError as error:
+                self.report({'WARNING'}, material.name + ": " + str(error))
+                continue
+            if not images:
+                continue
+            for image in images.values():
+                image.reload()
+            
+            PbrNodeTree.reconcile(material, images)
+            count += 1
         
+        if warnings:
+            self.report({'WARNING'}, "; ".join(warnings))
+        self.report({'INFO'}, "%d materials refreshed" % count)
         return {'FINISHED'}
     
     
@@ -661,22 +2083,36 @@ class DeleteUnusedData(Operator):
 class AddonPreferences(AddonPreferences):
     bl_idname = __name__
 
-    diffuse_suffixes = StringProperty(name="Diffuse")
-    albedo_suffixes = StringProperty(name="Albedo")
-    ao_suffixes = StringProperty(name="Ambient Occlusion")
-    roughness_suffixes = StringProperty(name="Roughness")
-    glossiness_suffixes = StringProperty(name="Glossiness")
-    normal_suffixes = StringProperty(name="Normal")
-    bump_suffixes = StringProperty(name="Bump")
-    height_suffixes = StringProperty(name="Height")
-    metallic_suffixes = StringProperty(name="Metallic")
-    specular_suffixes = StringProperty(name="Specular")
+    diffuse_suffixes = StringProperty(name="Diffuse", default=DEFAULT_SUFFIXES['diffuse_suffixes'])
+    albedo_suffixes = StringProperty(name="Albedo", default=DEFAULT_SUFFIXES['albedo_suffixes'])
+    ao_suffixes = StringProperty(name="Ambient Occlusion", default=DEFAULT_SUFFIXES['ao_suffixes'])
+    roughness_suffixes = StringProperty(name="Roughness", default=DEFAULT_SUFFIXES['roughness_suffixes'])
+    glossiness_suffixes = StringProperty(name="Glossiness", default=DEFAULT_SUFFIXES['glossiness_suffixes'])
+    normal_suffixes = StringProperty(name="Normal", default=DEFAULT_SUFFIXES['normal_suffixes'])
+    bump_suffixes = StringProperty(name="Bump", default=DEFAULT_SUFFIXES['bump_suffixes'])
+    height_suffixes = StringProperty(name="Height", default=DEFAULT_SUFFIXES['height_suffixes'])
+    metallic_suffixes = StringProperty(name="Metallic", default=DEFAULT_SUFFIXES['metallic_suffixes'])
+    specular_suffixes = StringProperty(name="Specular", default=DEFAULT_SUFFIXES['specular_suffixes'])
+    directx_suffixes = StringProperty(name="DirectX Normal", default=DEFAULT_SUFFIXES['directx_suffixes'])
+    opengl_suffixes = StringProperty(name="OpenGL Normal", default=DEFAULT_SUFFIXES['opengl_suffixes'])
     
+    preflight_scan = BoolProperty(name="Check the texture files before importing them", default=True,
+                                  description="Read the headers of the files to find broken or unsupported ones before loading them")
+    normal_cache_directory = StringProperty(name="Converted normal maps", subtype='DIR_PATH',
+                                            description="Directory where the DirectX normal maps converted to OpenGL are kept. "
+                                                        "If empty, they are kept in a mft_cache directory next to the textures")
+    detect_normal_format = BoolProperty(name="Detect DirectX normal maps from their pixels", default=True,
+                                        description="Analyse the normal maps without DirectX or OpenGL suffix to find their convention")
+
     show_suffixes = BoolProperty(name="File suffixes")
 
     def draw(self, context):
         layout = self.layout
         
+        layout.prop(self, "preflight_scan")
+        layout.prop(self, "detect_normal_format")
+        layout.prop(self, "normal_cache_directory")
+        
         if not self.show_suffixes:
             layout.prop(self, "show_suffixes", icon="TRIA_RIGHT")
             
@@ -694,38 +2130,56 @@ class AddonPreferences(AddonPreferences):
             layout.prop(self, "height_suffixes")
             layout.prop(self, "metallic_suffixes")
             layout.prop(self, "specular_suffixes")
-
-    @staticmethod
-    def init():
-        """set the default values for the file suffixes"""
-        prefs = bpy.context.user_preferences.addons['pbr_material_from_textures'].preferences
-        prefs["diffuse_suffixes"] = "Dif;Diffuse;BaseColor;Color;COL"
-        prefs["albedo_suffixes"] = "Alb;Albedo;ALBEDO"
-        prefs["ao_suffixes"] = "AO;Occlusion;OCCLUSION"
-        prefs["roughness_suffixes"] = "Rou;Roughness"
-        prefs["glossiness_suffixes"] = "Gloss;Glossiness;GLOSS"
-        prefs["normal_suffixes"] = "Nor;Normal;NRM;NORMAL"
-        prefs["bump_suffixes"] = "Bump"
-        prefs["height_suffixes"] = "Dis;Displacement;Height;DISP;DISPLACEMENT"
-        prefs["metallic_suffixes"] = "Met;Metallic;METALNESS"
-        prefs["specular_suffixes"] = "Ref;REFL;Specular;Reflection"
+            layout.prop(self, "directx_suffixes")
+            layout.prop(self, "opengl_suffixes")
 
 
 #--------------------------------------------------------------------------------------------------------
 # Register
 #--------------------------------------------------------------------------------------------------------
+classes = (
+    PBRMaterialProperties,
+    MaterialPanel,
+    ImportTexturesAsMaterial,
+    BatchImportLibrary,
+    PreflightScan,
+    RefreshMaterials,
+    ExportMaterialDescription,
+    ImportMaterialDescription,
+    CreateEmptyMrMaterial,
+    CreateEmptySgMaterial,
+    ResetNodeGroup,
+    DeleteUnusedData,
+    AddonPreferences,
+)
+
+
 def register():
-    bpy.utils.register_module(__name__)
+    for cls in classes:
+        bpy.utils.register_class(cls)
 
     bpy.types.Scene.mft_props = bpy.props.PointerProperty(type=PBRMaterialProperties)
-    AddonPreferences.init()
+    get_update_handlers().append(update_inventory)
     
 
 def unregister():
-    bpy.utils.unregister_module(__name__)
+    global thread_pool
+    get_update_handlers().remove(update_inventory)
+    
+    for cls in reversed(classes):
+        bpy.utils.unregister_class(cls)
     
     del bpy.types.Scene.mft_props
+    
+    if thread_pool is not None:
+        thread_pool.shutdown(wait=False)
+        thread_pool = None
 
 if __name__ == "__main__":
-    register()
+    # The arguments after "--" are for the script, not for Blender
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+    if argv and argv[0] in ("--farm", "--farm-worker", "--farm-merge"):
+        farm_main(argv)
+    else:
+        register()
     
\ No newline at end of file